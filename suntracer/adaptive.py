@@ -0,0 +1,107 @@
+'''
+FILE: adaptive.py
+AUTHOR: Mason Tea
+PURPOSE: Adaptive (quadtree) ray shooting refined around the critical curves.
+'''
+
+### LIBRARIES ###
+
+import numpy as np
+
+import tracer
+
+### DEFINITIONS ###
+
+BASE = 32                                                           # Side of the coarsest cells [image px], a power of 2
+TOL = 0.5                                                           # Allowed departure from a linear mapping [source px]
+FLOOR = 1.0E-6                                                      # Source values below FLOOR * max are outside the footprint
+
+### SOURCE FOOTPRINT ###
+
+def footprint(src, floor=FLOOR):                                    # Bounding box (lo1, hi1, lo2, hi2) of the source [px]
+    a = np.abs(src).reshape((-1,) + src.shape[-2:]).max(axis=0)
+    on = a > floor * a.max()
+    if not on.any():
+        return(None)
+    rows = np.flatnonzero(on.any(axis=1))
+    cols = np.flatnonzero(on.any(axis=0))
+    return(rows[0] - 1, rows[-1] + 1, cols[0] - 1, cols[-1] + 1)
+
+### CELL SAMPLES ###
+
+# Every cell of side s pixels is sampled by rays through its four corner pixels
+# and its centre. A cell of one pixel is a single ray through the pixel centre,
+# exactly as in tracer.suntracer.
+
+def samples(i0, j0, s, nx, xl, ny, yl, lens):                       # Source pixel coords (cells, samples) of the cells
+    xs = 2.0 * xl / (nx - 1)                                        # Pixel size on image map
+    ys = 2.0 * yl / (ny - 1)                                        # Pixel size on source map
+    if s == 1:
+        d = e = np.zeros(1)
+    else:
+        d = np.array([0.0, s - 1.0, 0.0, s - 1.0, (s - 1.0) / 2.0])
+        e = np.array([0.0, 0.0, s - 1.0, s - 1.0, (s - 1.0) / 2.0])
+    x1 = -xl + (j0[:,None] + d[None,:]) * xs
+    x2 = -xl + (i0[:,None] + e[None,:]) * xs
+
+    y1, y2 = lens(x1, x2)
+    return((y2 + yl) / ys, (y1 + yl) / ys)
+
+def values(src, p1, p2):                                            # Nearest source values, zero off the plane
+    ny = src.shape[-1]
+    ind = tracer.onplane(p1, p2, ny)
+    v = np.zeros(src.shape[:-2] + p1.shape, dtype=src.dtype)
+    v[..., ind] = src[..., np.round(p1[ind]).astype(np.intp), np.round(p2[ind]).astype(np.intp)]
+    return(v)
+
+### ADAPTIVE RAY SHOOTING ###
+
+# Starts from cells of side base over the image plane. A cell is split in four
+# while it is larger than a pixel and either its centre ray departs from the
+# mean of its corner rays by more than tol source pixels (the mapping varies
+# quickly, as around the Einstein ring) or the box spanned by its rays overlaps
+# the source footprint. Unsplit cells are painted with the mean of their
+# samples on the nx x nx output, so only the ring is resolved ray by ray.
+# Returns the lensed image (or stack) of src and the number of rays shot.
+
+def adaptive(lens, src, nx, xl, yl, base=BASE, tol=TOL, floor=FLOOR):
+    if base < 1 or base & (base - 1):
+        raise ValueError('base must be a power of 2, got %r' % (base,))
+    ny = src.shape[-1]
+    n = -(-nx // base) * base                                       # Canvas padded to whole coarse cells
+    out = np.zeros(src.shape[:-2] + (n,n), dtype=src.dtype)
+    box = footprint(src, floor)
+
+    i0, j0 = np.mgrid[0:n:base,0:n:base]
+    i0 = i0.ravel()
+    j0 = j0.ravel()
+    s = base
+    shot = 0
+    while len(i0) > 0:
+        p1, p2 = samples(i0, j0, s, nx, xl, ny, yl, lens)
+        shot += p1.size
+
+        split = np.zeros(len(i0), dtype=bool)
+        if s > 1:
+            bend = np.hypot(p1[:,4] - p1[:,:4].mean(axis=1), p2[:,4] - p2[:,:4].mean(axis=1))
+            split = bend > tol
+            if box is not None:
+                split |= ((p1.max(axis=1) >= box[0]) & (p1.min(axis=1) <= box[1]) &
+                          (p2.max(axis=1) >= box[2]) & (p2.min(axis=1) <= box[3]))
+
+        leaf = ~split
+        v = values(src, p1[leaf], p2[leaf]).mean(axis=-1)           # (..., cells)
+        cells = out.reshape(out.shape[:-2] + (n // s, s, n // s, s))
+        cells[..., i0[leaf] // s, :, j0[leaf] // s, :] = np.moveaxis(v, -1, 0)[..., None, None]
+
+        h = s // 2
+        i0 = i0[split]
+        j0 = j0[split]
+        i0 = np.concatenate((i0, i0 + h, i0, i0 + h))
+        j0 = np.concatenate((j0, j0, j0 + h, j0 + h))
+        keep = (i0 < nx) & (j0 < nx)                                # Drop cells wholly in the padding
+        i0 = i0[keep]
+        j0 = j0[keep]
+        s = h
+
+    return(np.ascontiguousarray(out[..., :nx, :nx]), shot)
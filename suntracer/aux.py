@@ -1,9 +1,11 @@
 import numpy as np
-import matplotlib.pyplot as plt
-import scipy.special as sci
 import math
 import random
-from astropy.io.fits import getdata
+
+import timing
+
+# scipy.special and astropy are imported where they are used, so that importing
+# aux (and the tracer built on it) stays fast on headless compute nodes
 
 
 ### CONSTANTS ###
@@ -51,6 +53,16 @@ def pt_lens(x1,x2,x1l,x2l,ml):
     y2 = x2 - ml*(x2-x2l)/d
     return(y1,y2)
 
+### POINT LENS ANNULUS ###
+
+# A point lens of mass ml maps image radius r to source radius |r - ml/r|, so
+# the image of every source point within rmax of the lens lies in this annulus
+
+def annulus(ml,rmax):                                                               # Image-plane radii (r_in, r_out)
+    r_in = (-rmax + math.sqrt(rmax**2 + 4.0*ml)) / 2.0
+    r_out = (rmax + math.sqrt(rmax**2 + 4.0*ml)) / 2.0
+    return(r_in,r_out)
+
 ### SINGULAR ISOTHERMAL SPHERE ###
 
 def sis(x1,x2,x1l,x2l,dl,ds):
@@ -69,18 +81,22 @@ def theta_gr(b):
 ### MAGNIFICATION ###
 
 def mag(lam,z,p):                                                                   # Magnification as a function of wavelength, lens distance and optical offset
+    import scipy.special as sci
     a = (((2.0 * math.pi)/(lam))*(math.sqrt(2*rg/z))) * p                           # Dimensionless Bessel variable
-    return(4.0 * math.pi**2 * (rg / lam) * sci.jv(0,a)**2)
+    return(4.0 * math.pi**2 * (rg / lam) * sci.j0(a)**2)
 
 ### GAIN ###
 
 def gain(lam,z,p):                                                                  # Gain as a function of wavelength, lens distance and optical offset
-    return(10 * np.log10(amp(lam,z,p)))
+    return(10 * np.log10(mag(lam,z,p)))
 
 ### FOR OPENING FITS FILES ###
 
 def fitsim(filename):
-    a = getdata(filename)
-    if (len(a.shape) > 2):
-        a = a[0]
-    return((1.0*a)/a.sum())
+    from astropy.io.fits import getdata
+    with timing.stage('fits'):
+        a = getdata(filename)
+        if (len(a.shape) > 2):
+            a = a[0]
+        a = (1.0*a)/a.sum()
+    return(a)
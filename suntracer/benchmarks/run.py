@@ -0,0 +1,110 @@
+'''
+FILE: benchmarks/run.py
+AUTHOR: Mason Tea
+PURPOSE: Time the tracer across grid sizes, lens models and source types.
+
+USAGE:   python benchmarks/run.py [--sizes 501 1001 2048 5000] [--repeat 3] [--out bench.json]
+
+Every case runs in a fresh interpreter, so its peak RSS is measured on its
+own. Results (rays/second, best wall time, peak RSS, git commit) are printed
+as a table and written as JSON for comparing commits on the same machine.
+'''
+
+### LIBRARIES ###
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+### DEFINITIONS ###
+
+SIZES = [501, 1001, 2048, 5000]                                     # Image plane pixels per side
+LENSES = ['point', 'sis']
+CHANNELS = [1, 3]                                                   # Single plane and RGB stack
+
+au = 1.496E11                                                       # au to m conversion [m]
+
+### CASE ###
+
+def run_case(nx, lens, channels, repeat):                           # Time one case in this process
+    from functools import partial
+    import numpy as np
+    import aux
+    import tracer
+
+    ny = nx
+    if lens == 'point':
+        model = partial(aux.pt_lens, x1l=0.1, x2l=0.0, ml=1.0)
+    else:
+        model = partial(aux.sis, x1l=0.1, x2l=0.0, dl=550.0 * au, ds=6.0E6 * au)
+    src = aux.cgs(ny, ny / 40.0, 0, 0)
+    if channels > 1:
+        src = np.stack([src] * channels)
+
+    best = float('inf')
+    for k in range(repeat):
+        start = time.perf_counter()
+        tracer.suntracer(model, src, nx, 2.0, 2.0)
+        best = min(best, time.perf_counter() - start)
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    rss = rss if sys.platform == 'darwin' else rss * 1024           # ru_maxrss is in kB on Linux
+    return({'nx': nx, 'lens': lens, 'channels': channels, 'seconds': best,
+            'rays_per_second': nx * nx / best, 'peak_rss_mb': rss / 2.0**20})
+
+def spawn_case(nx, lens, channels, repeat):                         # Run one case in a fresh interpreter
+    cmd = [sys.executable, os.path.abspath(__file__), '--case', str(nx), lens, str(channels), '--repeat', str(repeat)]
+    res = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    return(json.loads(res.stdout.splitlines()[-1]))
+
+def commit():                                                       # Current git commit, if any
+    try:
+        res = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, capture_output=True, text=True)
+        return(res.stdout.strip() or None)
+    except OSError:
+        return(None)
+
+### MAIN ###
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the SunTracer ray tracer.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--lenses', nargs='+', default=LENSES, choices=LENSES)
+    parser.add_argument('--channels', type=int, nargs='+', default=CHANNELS)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--out', default=None, help='JSON file for the results')
+    parser.add_argument('--case', nargs=3, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.case is not None:
+        nx, lens, channels = args.case
+        print(json.dumps(run_case(int(nx), lens, int(channels), args.repeat)))
+        return(0)
+
+    results = []
+    print('%6s %6s %4s %10s %14s %10s' % ('nx', 'lens', 'ch', 'best [s]', 'rays/s', 'RSS [MB]'))
+    for nx in args.sizes:
+        for lens in args.lenses:
+            for channels in args.channels:
+                r = spawn_case(nx, lens, channels, args.repeat)
+                results.append(r)
+                print('%6d %6s %4d %10.3f %14.4g %10.1f' % (r['nx'], r['lens'], r['channels'], r['seconds'],
+                                                            r['rays_per_second'], r['peak_rss_mb']))
+
+    report = {'commit': commit(), 'python': platform.python_version(), 'machine': platform.machine(),
+              'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results}
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+    return(0)
+
+if __name__ == '__main__':
+    sys.exit(main())
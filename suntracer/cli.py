@@ -0,0 +1,159 @@
+'''
+FILE: cli.py
+AUTHOR: Mason Tea
+PURPOSE: Config-driven batch runs of SunTracer.
+
+USAGE:   python cli.py [-j WORKERS] [--preview] [SCENE_OR_JOBLIST ...]
+
+Each argument is either a .scene file (see scenes/default.scene) or a job
+list: a text file naming one scene per line (blank lines and lines starting
+with # are skipped; relative paths are relative to the job list). With no
+arguments scenes/default.scene is rendered. Independent scenes run
+concurrently on -j worker processes. Output is written headless in the
+format given by the extension of the [output] path (.npy, .fits or .png);
+--preview also shows each render with matplotlib.
+'''
+
+### LIBRARIES ###
+
+import argparse
+import configparser
+import os
+import sys
+import time
+from functools import partial
+
+import numpy as np
+
+import aux
+import output
+import pool
+import tracer
+
+### DEFINITIONS ###
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SCENE = os.path.join(HERE, 'scenes', 'default.scene')
+
+DEFAULTS = {                                                        # Values used when a scene leaves a key out
+    'image': {'pixels': '1001', 'extent': '2.0', 'ss': '1', 'order': '0',
+              'precision': 'double', 'memory': ''},
+    'lens': {'type': 'point', 'x': '0.0', 'y': '0.0', 'mass': '1.0', 'dl': '', 'ds': ''},
+    'source': {'type': 'gaussian', 'pixels': '1001', 'extent': '2.0', 'x': '0.0', 'y': '0.0',
+               'radius': '0.05', 'files': ''},
+    'output': {'path': 'suntracer.npy'},
+}
+
+### SCENES ###
+
+def read_scene(path):                                               # Parsed scene with defaults filled in
+    scene = configparser.ConfigParser(inline_comment_prefixes=('#',))
+    scene.read_dict(DEFAULTS)
+    if not scene.read(path):
+        raise FileNotFoundError('scene file "%s" does not exist' % path)
+    here = os.path.dirname(os.path.abspath(path))                   # Paths are relative to the scene file
+    scene['output']['path'] = os.path.join(here, scene['output']['path'])
+    files = [f.strip() for f in scene['source']['files'].split(',') if f.strip()]
+    scene['source']['files'] = ', '.join(os.path.join(here, f) for f in files)
+    return(scene)
+
+def jobs(paths):                                                    # Scene files named by the arguments
+    scenes = []
+    for path in paths:
+        if path.endswith('.scene'):
+            scenes.append(path)
+            continue
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    scenes.append(os.path.join(os.path.dirname(path), line))
+    return(scenes)
+
+def lens_model(sec):                                                # Lens callable for a [lens] section
+    kind = sec['type']
+    if kind == 'point':
+        return(partial(aux.pt_lens, x1l=sec.getfloat('x'), x2l=sec.getfloat('y'), ml=sec.getfloat('mass')))
+    if kind == 'sis':
+        return(partial(aux.sis, x1l=sec.getfloat('x'), x2l=sec.getfloat('y'),
+                       dl=sec.getfloat('dl'), ds=sec.getfloat('ds')))
+    raise ValueError('unknown lens type "%s"' % kind)
+
+def source_plane(sec):                                              # Source plane (or stack) for a [source] section
+    ny = sec.getint('pixels')
+    ys = 2.0 * sec.getfloat('extent') / (ny - 1)                    # Pixel size on source map
+    kind = sec['type']
+    if kind == 'fits':
+        files = [f.strip() for f in sec['files'].split(',') if f.strip()]
+        src = np.stack([aux.fitsim(f) for f in files])
+        return(src[0] if len(files) == 1 else src)
+
+    ipos = int(round(sec.getfloat('x') / ys))                       # x (einrad) --> i (px)
+    jpos = int(round(-sec.getfloat('y') / ys))                      # y (einrad) --> j (px)
+    rpix = sec.getfloat('radius') / ys                              # r (einrad) --> r (px)
+    if kind == 'gaussian':
+        return(aux.cgs(ny,rpix,jpos,ipos))
+    if kind == 'circle':
+        return(aux.circ(ny,rpix,jpos,ipos))
+    raise ValueError('unknown source type "%s"' % kind)
+
+### RENDER ###
+
+def render(path):                                                   # Render one scene to its output file
+    scene = read_scene(path)
+    img = scene['image']
+    start = time.time()
+
+    src = source_plane(scene['source'])
+    nx = img.getint('pixels')
+    memory = img['memory']
+    b, mapped = tracer.suntracer(lens_model(scene['lens']), src, nx, img.getfloat('extent'),
+                                 scene['source'].getfloat('extent'),
+                                 memory=float(memory) if memory else None, ss=img.getint('ss'),
+                                 order=img.getint('order'),
+                                 dtype=np.float32 if img['precision'] == 'single' else np.float64)
+
+    out = scene['output']['path']
+    output.save(out, b)
+    return(path, out, 100.0 * mapped / (nx * nx * img.getint('ss')**2), time.time() - start)
+
+def load(path):                                                     # Read a rendered plane back for previews
+    if path.endswith('.npy'):
+        return(np.load(path))
+    if path.endswith('.png'):
+        from PIL import Image
+        return(np.asarray(Image.open(path)))
+    return(aux.fitsim(path))
+
+def _render(path, **shared):
+    return(render(path))
+
+### MAIN ###
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render SunTracer scenes.')
+    parser.add_argument('scenes', nargs='*', help='.scene files or job lists')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='scenes rendered concurrently')
+    parser.add_argument('--preview', action='store_true', help='show every render with matplotlib')
+    args = parser.parse_args(argv)
+
+    scenes = jobs(args.scenes or [DEFAULT_SCENE])
+    for path in scenes:
+        if not os.path.isfile(path):
+            print('Scene file "%s" does not exist' % path)
+            return(1)
+
+    if args.jobs > 1 and len(scenes) > 1:
+        results = pool.render(_render, scenes, workers=args.jobs)
+    else:
+        results = map(render, scenes)
+
+    for path, out, ratio, seconds in results:
+        print('%s -> %s   Mapped:Unmapped = %.2f%%   (%.2fs)' % (path, out, ratio, seconds))
+        if args.preview:
+            scene = read_scene(path)
+            output.preview(load(out), scene['image'].getfloat('extent'))
+    return(0)
+
+if __name__ == '__main__':
+    sys.exit(main())
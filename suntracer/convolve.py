@@ -0,0 +1,88 @@
+'''
+FILE: convolve.py
+AUTHOR: Mason Tea
+PURPOSE: Blur lensed images with the SGL point-spread function.
+'''
+
+### LIBRARIES ###
+
+import functools
+
+import numpy as np
+
+import aux
+import timing
+
+# scipy.signal is imported where it is used, like scipy.special in aux.py
+
+### DEFINITIONS ###
+
+KERNELS = 8                                                         # PSF kernels kept in memory
+OA_PIXELS = 4096                                                    # Image side above which overlap-add is used
+OA_SIZE = 1025                                                      # Default kernel side for overlap-add
+
+### PSF KERNEL ###
+
+# The SGL PSF is the magnification aux.mag(lam, z, rho) ~ J0(k sqrt(2 rg/z) rho)^2
+# as a function of the distance rho [m] from the optical axis. It is sampled
+# at the centres of a size x size grid of pixels scale [m] wide and normalized
+# to unit sum, so a blur keeps the flux of the image. The J0^2 wings fall off
+# only as 1/rho, so size should cover the image (the default in convolve,
+# except for overlap-add).
+# The KERNELS most recently used kernels are cached (read-only), since a sweep
+# of frames reuses the same few.
+
+@functools.lru_cache(maxsize=KERNELS)
+def kernel(lam, z, scale, size):                                    # Normalized (size, size) PSF kernel
+    with timing.stage('psf'):
+        x = (np.arange(size) - (size - 1) / 2.0) * scale            # Pixel centres [m]
+        rho = np.hypot(x[None,:], x[:,None])
+        psf = aux.mag(lam, z, rho)
+        psf /= psf.sum()
+    psf.flags.writeable = False
+    return(psf)
+
+### CONVOLUTION ###
+
+# img may be a single plane or a stack with channels in front (as returned by
+# tracer.suntracer); every plane is blurred with the same kernel, or, if lam
+# is a sequence with one wavelength per plane of an (n, ny, nx) stack, each
+# plane with the kernel of its own wavelength. The result has the shape of
+# img and a floating dtype of at least single precision (integer images are
+# not truncated). method is 'fft' (one transform of the whole image), 'oa'
+# (overlap-add in blocks, for images too large to transform at once or
+# kernels much smaller than the image) or 'auto', which picks 'oa' above
+# OA_PIXELS or for a size of at most a quarter of the image.
+#
+# Overlap-add only bounds memory if the kernel is much smaller than the image,
+# so without a size it uses an OA_SIZE kernel instead of one covering the
+# image. The J0^2 wings beyond it are dropped and the rest renormalized to
+# unit sum, which puts more of the flux into the core: pass size (or
+# method='fft') where the far wings matter.
+
+def convolve(img, lam, z, scale, size=None, method='auto'):        # img blurred by the SGL PSF
+    from scipy import signal
+    n = max(img.shape[-2:])
+    if method == 'auto':
+        method = 'oa' if n > OA_PIXELS or (size is not None and 4 * size <= n) else 'fft'
+    if size is None:
+        size = 2 * (n // 2) + 1                                     # Odd, so the kernel has a centre pixel
+        if method == 'oa':
+            size = min(size, OA_SIZE)                               # Truncated wings (see above)
+    dtype = np.result_type(img.dtype, np.float32)                   # A unit-sum kernel is all zeros as an integer
+    if np.ndim(lam) == 0:
+        psf = kernel(float(lam), float(z), float(scale), int(size)).astype(dtype, copy=False)
+        psf = psf.reshape((1,) * (img.ndim - 2) + psf.shape)
+    elif img.ndim == 3 and len(lam) == img.shape[0]:
+        psf = np.stack([kernel(float(l), float(z), float(scale), int(size)) for l in lam]).astype(dtype, copy=False)
+    else:
+        raise ValueError('need one wavelength per plane of an (n, ny, nx) stack, got %d for %s' % (len(lam), img.shape))
+
+    with timing.stage('convolve'):
+        if method == 'oa':
+            out = signal.oaconvolve(img, psf, mode='same', axes=(-2,-1))
+        elif method == 'fft':
+            out = signal.fftconvolve(img, psf, mode='same', axes=(-2,-1))
+        else:
+            raise ValueError('unknown convolution method "%s" (use auto, fft or oa)' % method)
+    return(out)
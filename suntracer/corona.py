@@ -0,0 +1,64 @@
+'''
+FILE: corona.py
+AUTHOR: Mason Tea
+PURPOSE: Solar corona background on the suntracer image plane.
+'''
+
+### LIBRARIES ###
+
+import functools
+import math
+
+import numpy as np
+
+import aux
+import timing
+import tracer
+
+### DEFINITIONS ###
+
+RADII = 4096                                                        # Samples of the 1D profile
+CACHED = 4                                                          # Backgrounds kept in memory
+
+### PROFILE ###
+
+# The radial shape of the corona is the power law of the plasma model in
+# grav_tele/turshyev_andersson_revised.py,
+#
+#     2952 (R/b)^16 + 228 (R/b)^6 + 1.1 (R/b)^2
+#
+# as a function of impact parameter b [solar radii], normalized to 1 at the
+# limb. Everything inside the limb (b < 1) is occulted by the Sun.
+
+def profile(b):                                                     # Relative corona brightness at b [R_sun]
+    b = np.asarray(b, dtype=np.float64)
+    u = 1.0 / np.maximum(b, 1.0)
+    p = (2952.0 * u**16 + 228.0 * u**6 + 1.1 * u**2) / 3181.1
+    return(np.where(b < 1.0, 0.0, p))
+
+def limb(z):                                                        # Image-plane radius of the solar limb [theta_E]
+    return(math.sqrt(aux.z0 / z))                                   # The ring lies at b = sqrt(z/z0) R_sun
+
+### BACKGROUND ###
+
+# The background is radially symmetric about the Sun at center [theta_E], so
+# the profile is evaluated once along a radius and interpolated onto the
+# nx x nx image plane (same pixel convention as tracer.suntracer). rsun is
+# the image-plane radius of the solar limb [theta_E], e.g. limb(z), and level
+# the brightness at the limb in the units wanted (e.g. e-/s per pixel, to be
+# added to noise.rate). The CACHED most recently used backgrounds are kept
+# (read-only), so a run over many frames pays for each one once.
+
+def background(nx, xl, rsun, level=1.0, center=(0.0, 0.0)):        # Corona brightness on the image plane
+    return(_background(int(nx), float(xl), float(rsun), float(level), tuple(map(float, center))))
+
+@functools.lru_cache(maxsize=CACHED)
+def _background(nx, xl, rsun, level, center):
+    with timing.stage('corona'):
+        x1, x2 = tracer.axes(nx, xl)
+        r = np.hypot(x1 - center[0], x2 - center[1])
+        rr = np.linspace(rsun, max(r.max(), rsun), RADII)           # Profile from the limb outwards
+        bg = np.interp(r, rr, level * profile(rr / rsun))
+        bg[r < rsun] = 0.0                                          # Occulted by the Sun
+    bg.flags.writeable = False
+    return(bg)
@@ -0,0 +1,116 @@
+'''
+FILE: deconvolve.py
+AUTHOR: Mason Tea
+PURPOSE: Recover images blurred by the SGL PSF (Wiener filter, Richardson-Lucy).
+'''
+
+### LIBRARIES ###
+
+import functools
+
+import numpy as np
+from scipy import fft
+
+import convolve
+import pool
+import timing
+
+### DEFINITIONS ###
+
+THREADS = -1                                                        # FFT threads (-1: every core)
+SPECTRA = 8                                                         # Kernel spectra kept in memory
+ITERATIONS = 50                                                     # Richardson-Lucy iterations at most
+TOL = 1.0E-4                                                        # Relative change that stops Richardson-Lucy
+
+### KERNEL SPECTRUM ###
+
+# Images are blurred and deblurred on a zero-padded grid at least
+# ny + size - 1 pixels wide, so the FFT products are linear (not circular)
+# convolutions and agree with convolve.convolve. The PSF of convolve.kernel
+# is placed with its centre at pixel (0, 0) of that grid; its real FFT H is
+# cached (the SPECTRA most recently used, read-only), so every Richardson-Lucy
+# iteration costs only the image FFTs.
+
+def spectrum(lam, z, scale, size, shape):                           # rfft2 of the PSF and the padded shape
+    return(_spectrum(float(lam), float(z), float(scale), int(size), tuple(int(n) for n in shape)))
+
+@functools.lru_cache(maxsize=SPECTRA)
+def _spectrum(lam, z, scale, size, shape):
+    pad = tuple(fft.next_fast_len(n + size - 1, real=True) for n in shape)
+    psf = np.zeros(pad)
+    psf[:size, :size] = convolve.kernel(lam, z, scale, size)
+    psf = np.roll(psf, (-(size // 2), -(size // 2)), axis=(0,1))    # Centre of the kernel at (0, 0)
+    H = fft.rfft2(psf, workers=THREADS)
+    H.flags.writeable = False
+    return(H, pad)
+
+def _apply(a, H, pad, threads):                                     # a (or a stack) filtered by H, cropped to a
+    b = fft.irfft2(fft.rfft2(a, s=pad, workers=threads) * H, s=pad, workers=threads)
+    return(b[..., :a.shape[-2], :a.shape[-1]])
+
+def _size(img, size):                                               # Kernel size of convolve.convolve (method='fft')
+    n = max(img.shape[-2:])
+    return(2 * (n // 2) + 1 if size is None else size)
+
+### WIENER FILTER ###
+
+# One step: X = conj(H) Y / (|H|^2 + 1/snr^2), with snr the signal-to-noise
+# ratio of the blurred image. img may be a plane or a stack of planes.
+
+def wiener(img, lam, z, scale, snr=100.0, size=None, threads=THREADS):
+    img = np.asarray(img, dtype=np.float64)                         # Wiener estimate of the unblurred img
+    H, pad = spectrum(lam, z, scale, _size(img, size), img.shape[-2:])
+    with timing.stage('wiener'):
+        out = _apply(img, np.conj(H) / (np.abs(H)**2 + 1.0 / snr**2), pad, threads)
+    return(out)
+
+### RICHARDSON-LUCY ###
+
+# x <- x * K^T(img / K x) / K^T 1, starting from a flat image of the same
+# flux. It stops after iterations steps, or earlier once the estimate changes
+# by less than tol (relative, in the L2 norm) in one step. img should be
+# non-negative, e.g. a noisy frame clipped at zero. Returns the estimate and
+# the number of iterations run.
+
+def richardson_lucy(img, lam, z, scale, iterations=ITERATIONS, tol=TOL, size=None, threads=THREADS):
+    if iterations < 1:                                              # Estimate of the unblurred img, iterations run
+        raise ValueError('need at least one Richardson-Lucy iteration, got %d' % iterations)
+    img = np.asarray(img, dtype=np.float64)
+    H, pad = spectrum(lam, z, scale, _size(img, size), img.shape[-2:])
+    Ht = np.conj(H)                                                 # Adjoint (correlation) of the blur
+    tiny = np.finfo(np.float64).tiny
+
+    with timing.stage('richardson-lucy'):
+        norm = np.maximum(_apply(np.ones(img.shape[-2:]), Ht, pad, threads), tiny)
+        x = np.empty_like(img)
+        x[...] = img.sum(axis=(-2,-1), keepdims=True) / (img.shape[-2] * img.shape[-1])
+        for k in range(1, iterations + 1):
+            blur = _apply(x, H, pad, threads)
+            step = _apply(img / np.maximum(blur, tiny), Ht, pad, threads) / norm
+            change = np.linalg.norm(x * (step - 1.0)) / max(np.linalg.norm(x), tiny)
+            x *= step
+            if change < tol:
+                break
+    return(x, k)
+
+### BATCHES ###
+
+# Deconvolves a stack of frames (n, ny, nx) frame by frame across a pool of
+# workers (each running single-threaded FFTs), with the frames passed once in
+# shared memory. method is 'rl' or 'wiener'; kwargs go to that method.
+
+def _frame(params, frames):
+    method, k, lam, z, scale, kwargs = params
+    if method == 'wiener':
+        return(wiener(frames[k], lam, z, scale, threads=1, **kwargs))
+    return(richardson_lucy(frames[k], lam, z, scale, threads=1, **kwargs)[0])
+
+def batch(frames, lam, z, scale, method='rl', workers=None, **kwargs):
+    if method not in ('rl', 'wiener'):                              # Deconvolved stack of frames
+        raise ValueError('unknown deconvolution method "%s" (use rl or wiener)' % method)
+    frames = np.asarray(frames, dtype=np.float64)
+    params = [(method, k, lam, z, scale, kwargs) for k in range(len(frames))]
+    out = np.empty_like(frames)
+    for k, x in enumerate(pool.render(_frame, params, shared={'frames': frames}, workers=workers)):
+        out[k] = x
+    return(out)
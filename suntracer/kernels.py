@@ -0,0 +1,78 @@
+'''
+FILE: kernels.py
+AUTHOR: Mason Tea
+PURPOSE: Optional Numba kernels fusing the point-lens trace into one pass.
+'''
+
+### LIBRARIES ###
+
+import numpy as np
+
+import aux
+
+try:                                                                # Numba is optional: without it the kernels
+    from numba import njit, prange                                  # are never used and tracer.py takes its
+except ImportError:                                                 # NumPy path
+    njit = None
+    prange = range
+
+### FUSED POINT LENS ###
+
+# The NumPy path of tracer.suntracer makes about eight full-size temporaries
+# per tile (x1ml, x2ml, d, y1, y2, i1, i2, ind). For a point lens this kernel
+# does the deflection of aux.pt_lens, the rounding, the bounds check and the
+# source lookup for one pixel at a time, in a parallel loop over image rows,
+# so nothing but src, out and one row of sums is ever touched in memory.
+# Sub-ray offsets are summed in float64 in the same order as tracer.suntracer
+# and each pixel is written once (rounded if rint, for integer images), so the
+# images agree for every dtype.
+#
+# src is (channels, ny, ny) and out is (channels, rows, nx) for image rows
+# r0 <= j1 < r0 + rows; the number of mapped (sub-)rays is returned.
+
+def _pt_gather(src, out, r0, xl, xs, yl, ys, offsets, x1l, x2l, ml, rint):
+    nc = src.shape[0]
+    ny = src.shape[-1]
+    rows = out.shape[1]
+    nx = out.shape[2]
+    nk = offsets.shape[0]
+    mapped = np.zeros(rows, dtype=np.int64)
+
+    for r in prange(rows):
+        acc = np.zeros((nc, nx))                                    # float64 sums of this row
+        for j in range(nx):
+            for k in range(nk):
+                x1 = -xl + (j + offsets[k, 0]) * xs
+                x2 = -xl + (r0 + r + offsets[k, 1]) * xs
+                x1ml = x1 - x1l
+                x2ml = x2 - x2l
+                d = x1ml * x1ml + x2ml * x2ml + 1.0E-12
+                i1 = np.rint((x2 - ml * x2ml / d + yl) / ys)         # Source row and column of the ray
+                i2 = np.rint((x1 - ml * x1ml / d + yl) / ys)
+                if i1 >= 0 and i1 < ny and i2 >= 0 and i2 < ny:
+                    mapped[r] += 1
+                    for c in range(nc):
+                        acc[c, j] += src[c, int(i1), int(i2)]
+            for c in range(nc):
+                v = acc[c, j] / nk if nk > 1 else acc[c, j]
+                out[c, r, j] = np.rint(v) if rint else v
+    return(mapped.sum())
+
+if njit is not None:
+    _pt_gather = njit(parallel=True, cache=True)(_pt_gather)
+
+def fused(lens, src):                                               # True if the fused kernel can trace lens onto src
+    if njit is None or src.ndim > 3:
+        return(False)
+    return(getattr(lens, 'func', None) is aux.pt_lens and not lens.args)
+
+def pt_gather(lens, src, out, nx, xl, yl, offsets, r0=0):           # Trace a point lens straight into out
+    ny = src.shape[-1]
+    xs = 2.0 * xl / (nx - 1)                                        # Pixel size on image map
+    ys = 2.0 * yl / (ny - 1)                                        # Pixel size on source map
+    kw = lens.keywords
+    src3 = np.asarray(src).reshape((-1,) + src.shape[-2:])
+    out3 = np.asarray(out).reshape((-1,) + out.shape[-2:])          # Views, so out is written in place
+    return(int(_pt_gather(src3, out3, r0, float(xl), xs, float(yl), ys, np.asarray(offsets, dtype=np.float64),
+                          float(kw['x1l']), float(kw['x2l']), float(kw['ml']),
+                          bool(np.issubdtype(out.dtype, np.integer)))))
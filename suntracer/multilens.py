@@ -0,0 +1,131 @@
+'''
+FILE: multilens.py
+AUTHOR: Mason Tea
+PURPOSE: Deflection by many point masses (Sun plus planets, microlensing star fields).
+'''
+
+### LIBRARIES ###
+
+import numpy as np
+
+### DEFINITIONS ###
+
+NEXACT = 64                                                         # Lens count up to which deflections are summed exactly
+LEAF = 8                                                            # Lenses per tree leaf
+CHUNK = 2**20                                                       # Ray-lens pairs per block of the exact sum
+TREES = 4                                                           # Lens trees kept in memory
+
+### EXACT SUM ###
+
+# Same units and convention as aux.pt_lens: each mass deflects a ray at x by
+# ml * (x - xl) / |x - xl|**2. Blocks of lenses keep the ray x lens
+# temporaries under CHUNK elements.
+
+def _exact(x1, x2, x1l, x2l, ml):                                   # Summed deflection of every ray
+    a1 = np.zeros_like(x1)
+    a2 = np.zeros_like(x2)
+    step = max(1, CHUNK // max(1, x1.size))
+    for k in range(0, len(ml), step):
+        dx1 = x1[:,None] - x1l[None,k:k+step]
+        dx2 = x2[:,None] - x2l[None,k:k+step]
+        w = ml[k:k+step] / (dx1**2 + dx2**2 + 1.0E-12)
+        a1 += np.sum(w * dx1, axis=1)
+        a2 += np.sum(w * dx2, axis=1)
+    return(a1, a2)
+
+### TREE ###
+
+# Quadtree over the lens positions. Each node stores its centre of mass, total
+# mass and side length, and either four children or the lenses of its leaf.
+
+class Node:
+    def __init__(self, x1l, x2l, ml, cx, cy, size):
+        self.mass = float(ml.sum())
+        self.c1 = float(np.sum(ml * x1l) / self.mass)               # Centre of mass
+        self.c2 = float(np.sum(ml * x2l) / self.mass)
+        self.size = size
+        self.children = []
+        self.lenses = None
+
+        if len(ml) <= LEAF or size < 1.0E-12:
+            self.lenses = (x1l, x2l, ml)
+            return
+
+        h = size / 2.0
+        right = x1l >= cx
+        top = x2l >= cy
+        for sel, qx, qy in ((~right & ~top, cx - h/2, cy - h/2), (right & ~top, cx + h/2, cy - h/2),
+                            (~right & top, cx - h/2, cy + h/2), (right & top, cx + h/2, cy + h/2)):
+            if np.any(sel):
+                self.children.append(Node(x1l[sel], x2l[sel], ml[sel], qx, qy, h))
+
+# Trees are cached keyed by the bytes of the lens arrays (which functools.lru_cache
+# cannot hash); the least recently used is dropped past TREES.
+
+_trees = {}                                                         # Recently used trees, oldest first
+
+def tree(x1l, x2l, ml):                                             # Root node enclosing every lens
+    k = (x1l.tobytes(), x2l.tobytes(), ml.tobytes())
+    if k in _trees:
+        _trees[k] = _trees.pop(k)                                   # Now the most recently used
+        return(_trees[k])
+    if len(_trees) >= TREES:
+        _trees.pop(next(iter(_trees)))
+    cx = (x1l.min() + x1l.max()) / 2.0
+    cy = (x2l.min() + x2l.max()) / 2.0
+    size = max(x1l.max() - x1l.min(), x2l.max() - x2l.min()) * (1.0 + 1.0E-9) + 1.0E-12
+    _trees[k] = Node(x1l, x2l, ml, cx, cy, size)
+    return(_trees[k])
+
+### BARNES-HUT ###
+
+# Rays far enough from a node (size / distance < theta) see its monopole at the
+# centre of mass; the rest descend into the children, down to an exact sum over
+# the leaf. Every node works on the whole subset of rays that reach it at once.
+
+def _walk(node, x1, x2, idx, a1, a2, theta):
+    d1 = x1[idx] - node.c1
+    d2 = x2[idx] - node.c2
+    r2 = d1**2 + d2**2 + 1.0E-12
+    far = node.size**2 < theta**2 * r2
+
+    w = node.mass / r2[far]
+    a1[idx[far]] += w * d1[far]
+    a2[idx[far]] += w * d2[far]
+
+    near = idx[~far]
+    if len(near) == 0:
+        return
+    if node.lenses is not None:
+        e1, e2 = _exact(x1[near], x2[near], *node.lenses)
+        a1[near] += e1
+        a2[near] += e2
+        return
+    for child in node.children:
+        _walk(child, x1, x2, near, a1, a2, theta)
+
+### MULTIPLE POINT LENSES ###
+
+# Drop-in replacement for aux.pt_lens taking arrays of lens positions and
+# masses. Up to nexact lenses are summed exactly; above that a Barnes-Hut tree
+# with opening angle theta is used (smaller theta is slower and more exact).
+#
+#     lens = functools.partial(multilens.multi_lens, x1l=xs, x2l=ys, ml=ms)
+
+def multi_lens(x1, x2, x1l, x2l, ml, theta=0.5, nexact=NEXACT):
+    x1l = np.atleast_1d(np.asarray(x1l, dtype=np.float64))
+    x2l = np.atleast_1d(np.asarray(x2l, dtype=np.float64))
+    ml = np.atleast_1d(np.asarray(ml, dtype=np.float64))
+    x1, x2 = np.broadcast_arrays(np.asarray(x1, dtype=np.float64), np.asarray(x2, dtype=np.float64))
+    shape = x1.shape
+    x1 = x1.ravel()
+    x2 = x2.ravel()
+
+    if len(ml) <= nexact:
+        a1, a2 = _exact(x1, x2, x1l, x2l, ml)
+    else:
+        a1 = np.zeros_like(x1)
+        a2 = np.zeros_like(x2)
+        _walk(tree(x1l, x2l, ml), x1, x2, np.arange(x1.size), a1, a2, theta)
+
+    return((x1 - a1).reshape(shape), (x2 - a2).reshape(shape))
@@ -0,0 +1,84 @@
+'''
+FILE: noise.py
+AUTHOR: Mason Tea
+PURPOSE: Photon shot noise, detector noise and co-adds of rendered images.
+'''
+
+### LIBRARIES ###
+
+import numpy as np
+
+import pool
+import timing
+
+### DEFINITIONS ###
+
+READ = 3.0                                                          # Read noise [e-/pixel rms]
+DARK = 0.002                                                        # Dark current [e-/(pixel*s)]
+QE = 0.9                                                            # Quantum efficiency
+FRAMES = 16                                                         # Frames co-added per pool task
+
+### PHOTON RATES ###
+
+# Rendered images are normalized (aux.cgs, aux.circ and aux.fitsim divide by
+# the sum), so an image is scaled to a detector by the total photon rate
+# flux [photons/s] it receives. rate is the expected signal of every pixel
+# [e-/s]; dark current is added on top of it when a frame is exposed.
+
+def rate(img, flux, qe=QE):                                         # Expected signal of every pixel [e-/s]
+    img = np.asarray(img, dtype=np.float64)
+    return(img * (qe * flux / img.sum()))
+
+def snr(img, flux, t, nframes=1, qe=QE, read=READ, dark=DARK):      # Expected SNR of every pixel of a co-add
+    s = rate(img, flux, qe) * t
+    return(np.sqrt(nframes) * s / np.sqrt(s + dark * t + read**2))
+
+### FRAMES ###
+
+# Every frame k of a run draws from its own stream, the k-th child of
+# SeedSequence(seed) (np.random.SeedSequence(seed).spawn), so frames are
+# independent and the same seed gives the same frames however they are
+# split between workers.
+
+def stream(seed, k):                                                # Generator of frame k
+    return(np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(k,))))
+
+def expose(r, t, rng, read=READ, dark=DARK):                        # One noisy frame [e-] of a rate map r [e-/s]
+    with timing.stage('noise'):
+        frame = rng.poisson(r * t + dark * t).astype(np.float64)
+        frame += rng.normal(0.0, read, r.shape)
+    return(frame)
+
+### CO-ADDS ###
+
+# coadd sums nframes exposures of t seconds without keeping the frames: each
+# task draws FRAMES frames into one running sum, and with workers > 1 the
+# tasks run in a process pool with the rate map in shared memory. Returns the
+# co-added image [e-] and the per-pixel sample variance of the frames.
+
+def _frames(params, r):                                             # Sum and sum of squares of frames k0 <= k < k1
+    seed, k0, k1, t, read, dark = params
+    total = np.zeros(r.shape)
+    squares = np.zeros(r.shape)
+    for k in range(k0, k1):
+        frame = expose(r, t, stream(seed, k), read, dark)
+        total += frame
+        squares += frame**2
+    return(total, squares)
+
+def coadd(img, flux, t, nframes, seed=None, qe=QE, read=READ, dark=DARK, workers=1):
+    r = rate(img, flux, qe)
+    seed = np.random.SeedSequence(seed).entropy                     # Fixed here, so every worker agrees
+    params = [(seed, k0, min(k0 + FRAMES, nframes), t, read, dark) for k0 in range(0, nframes, FRAMES)]
+    if workers > 1 and len(params) > 1:
+        parts = pool.render(_frames, params, shared={'r': r}, workers=workers)
+    else:
+        parts = (_frames(p, r) for p in params)
+
+    total = np.zeros(r.shape)
+    squares = np.zeros(r.shape)
+    for s, s2 in parts:
+        total += s
+        squares += s2
+    var = (squares - total**2 / nframes) / max(nframes - 1, 1)
+    return(total, var)
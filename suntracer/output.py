@@ -0,0 +1,58 @@
+'''
+FILE: output.py
+AUTHOR: Mason Tea
+PURPOSE: Headless output of rendered planes (NPY/FITS/PNG) and optional previews.
+'''
+
+### LIBRARIES ###
+
+import os
+
+import numpy as np
+
+import timing
+
+# astropy, PIL and matplotlib are only imported by the writer that needs them;
+# nothing here touches pyplot unless a preview is asked for.
+
+### WRITERS ###
+
+def save_npy(path, a):
+    np.save(path, a)
+
+def save_fits(path, a):
+    from astropy.io import fits
+    fits.PrimaryHDU(data=np.asarray(a)).writeto(path, overwrite=True)
+
+def save_png(path, a):                                              # 8-bit PNG, grey or RGB for 3 channels
+    from PIL import Image
+    a = np.asarray(a, dtype=np.float64)
+    if a.ndim == 3:
+        a = np.moveaxis(a, 0, -1)                                   # (channel, ny, nx) --> (ny, nx, channel)
+    peak = a.max()
+    a = np.clip(a / peak if peak > 0 else a, 0.0, 1.0)
+    img = np.round(a * 255.0).astype(np.uint8)
+    Image.fromarray(img, mode='RGB' if img.ndim == 3 else 'L').save(path)
+
+WRITERS = {'.npy': save_npy, '.fits': save_fits, '.fit': save_fits, '.png': save_png}
+
+def save(path, a):                                                  # Write a plane (or stack) by file extension
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in WRITERS:
+        raise ValueError('unknown output format "%s" (use %s)' % (ext, ', '.join(sorted(WRITERS))))
+    with timing.stage('save'):
+        WRITERS[ext](path, a)
+
+### PREVIEW ###
+
+def preview(img, extent, src=None, src_extent=None, cmap='hot'):    # Show the image (and source) with pyplot
+    with timing.stage('plot'):
+        import matplotlib.pyplot as plt
+
+        planes = [(src, src_extent), (img, extent)] if src is not None else [(img, extent)]
+        for k, (a, e) in enumerate(planes):
+            ax = plt.subplot(1, len(planes), k + 1)
+            a = np.asarray(a)
+            ax.imshow(a if a.ndim == 2 else a[0], extent=(-e,e,-e,e), cmap=cmap)
+            plt.axis('off')
+    plt.show()                                                      # Time spent in the window is not counted
@@ -0,0 +1,66 @@
+'''
+FILE: pool.py
+AUTHOR: Mason Tea
+PURPOSE: Parallel rendering of frame and parameter sweeps across a process pool.
+'''
+
+### LIBRARIES ###
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing import shared_memory
+
+import numpy as np
+
+### SHARED INPUTS ###
+
+# Large read-only inputs (source planes, cached ray maps) are copied once into
+# shared memory blocks; every worker maps the same blocks instead of receiving
+# a pickled copy with each task.
+
+_blocks = []                                                        # Shared memory blocks held open by this process
+_shared = {}                                                        # Arrays attached in a worker, by name
+
+def share(arrays):                                                  # Copy arrays into shared memory
+    blocks, specs = [], {}
+    for name, a in arrays.items():
+        a = np.ascontiguousarray(a)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, a.nbytes))
+        np.ndarray(a.shape, dtype=a.dtype, buffer=shm.buf)[...] = a
+        blocks.append(shm)
+        specs[name] = (shm.name, a.shape, a.dtype.str)
+    return(blocks, specs)
+
+def _attach(specs):                                                 # Worker initializer
+    for name, (shm_name, shape, dtype) in specs.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        a = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        a.flags.writeable = False
+        _blocks.append(shm)
+        _shared[name] = a
+
+def _call(func, params):
+    return(func(params, **_shared))
+
+### PARALLEL RENDER ###
+
+# func(params, **shared) is called once per entry of params in a pool of
+# workers (default: one per core) and the results are yielded in the order of
+# params. func must be a module-level function so it can be sent to the
+# workers, e.g. rendering one frame of a sweep:
+#
+#     def frame(shift, src, i1, i2, ind):
+#         return(next(tracer.sweep(None, src, nx, xl, yl, [shift], rmap=(i1, i2, ind))))
+#
+#     frames = pool.render(frame, shifts, shared={'src': src, 'i1': i1, 'i2': i2, 'ind': ind})
+
+def render(func, params, shared=None, workers=None):
+    blocks, specs = share(shared or {})
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach, initargs=(specs,)) as ex:
+            for result in ex.map(partial(_call, func), params):
+                yield result
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
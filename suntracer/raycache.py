@@ -0,0 +1,122 @@
+'''
+FILE: raycache.py
+AUTHOR: Mason Tea
+PURPOSE: Persistent on-disk cache of traced ray maps, keyed by lens and grid parameters.
+'''
+
+### LIBRARIES ###
+
+import functools
+import hashlib
+import os
+
+import numpy as np
+
+import tracer
+
+### DEFINITIONS ###
+
+CACHE_DIR = os.environ.get('SUNTRACER_CACHE',
+                           os.path.join(os.path.expanduser('~'), '.cache', 'suntracer'))
+CACHE_MAX = 4.0E9                                                   # Size cap of the cache directory [bytes]
+
+PARTS = ('i1', 'i2', 'ind')                                         # One .npy file per part of a ray map
+
+### CACHE KEY ###
+
+# Lenses are keyed by the function they wrap and its bound parameters, so they
+# must be functools.partial objects (see tracer.py); lambdas cannot be keyed.
+
+def _feed(h, v):
+    if isinstance(v, np.ndarray):
+        h.update(('%s%s' % (v.dtype.str, v.shape)).encode())
+        h.update(np.ascontiguousarray(v).tobytes())
+    elif isinstance(v, (tuple, list)):
+        h.update(b'(')
+        for u in v:
+            _feed(h, u)
+        h.update(b')')
+    else:
+        h.update(repr(v).encode())
+    h.update(b';')
+
+def key(lens, nx, xl, ny, yl):                                      # Hash of the lens and grid parameters
+    if not isinstance(lens, functools.partial):
+        raise ValueError('only functools.partial lenses can be cached, got %r' % (lens,))
+    h = hashlib.sha1()
+    _feed(h, (lens.func.__module__, lens.func.__qualname__))
+    _feed(h, lens.args)
+    _feed(h, sorted(lens.keywords.items()))
+    _feed(h, (int(nx), float(xl), int(ny), float(yl)))
+    return(h.hexdigest())
+
+### CACHE FILES ###
+
+def _path(cache_dir, k, part):
+    return(os.path.join(cache_dir, '%s.%s.npy' % (k, part)))
+
+def _entries(cache_dir):                                            # {key: (last use, bytes)} of cached maps
+    entries = {}
+    for name in os.listdir(cache_dir):
+        if not name.endswith('.npy'):
+            continue
+        st = os.stat(os.path.join(cache_dir, name))
+        k = name.split('.')[0]
+        used, size = entries.get(k, (0.0, 0))
+        entries[k] = (max(used, st.st_mtime), size + st.st_size)
+    return(entries)
+
+def evict(cache_dir=None, max_bytes=None, keep=None):               # Drop least recently used maps until under the cap
+    cache_dir = CACHE_DIR if cache_dir is None else cache_dir
+    max_bytes = CACHE_MAX if max_bytes is None else max_bytes
+    entries = _entries(cache_dir)
+    total = sum(size for used, size in entries.values())
+    for k in sorted(entries, key=lambda k: entries[k][0]):
+        if total <= max_bytes:
+            break
+        if k == keep:
+            continue
+        for part in PARTS:
+            try:
+                os.remove(_path(cache_dir, k, part))
+            except FileNotFoundError:
+                pass
+        total -= entries[k][1]
+
+### CACHED RAY MAP ###
+
+# Same as tracer.raymap, but the map is stored as int32 indices plus a boolean
+# mask and returned as read-only memory maps. A new source through a cached
+# geometry then costs a single tracer.gather:
+#
+#     img = tracer.gather(src, *raycache.raymap(lens, nx, xl, ny, yl))
+
+def raymap(lens, nx, xl, ny, yl, cache_dir=None, max_bytes=None, memory=None):
+    cache_dir = CACHE_DIR if cache_dir is None else cache_dir
+    os.makedirs(cache_dir, exist_ok=True)
+    k = key(lens, nx, xl, ny, yl)
+    paths = [_path(cache_dir, k, part) for part in PARTS]
+
+    if all(os.path.exists(p) for p in paths):
+        for p in paths:
+            os.utime(p)                                             # Mark as recently used
+        return(tuple(np.load(p, mmap_mode='r') for p in paths))
+
+    tmp = [p + '.tmp%d' % os.getpid() for p in paths]
+    i1 = np.lib.format.open_memmap(tmp[0], mode='w+', dtype=np.int32, shape=(nx,nx))
+    i2 = np.lib.format.open_memmap(tmp[1], mode='w+', dtype=np.int32, shape=(nx,nx))
+    ind = np.lib.format.open_memmap(tmp[2], mode='w+', dtype=np.bool_, shape=(nx,nx))
+
+    step = tracer.tile_rows(nx, memory)
+    for r0 in range(0, nx, step):
+        r1 = min(r0 + step, nx)
+        i1[r0:r1], i2[r0:r1], ind[r0:r1] = tracer.raymap(lens, nx, xl, ny, yl, rows=(r0,r1))
+
+    for a in (i1, i2, ind):
+        a.flush()
+    del i1, i2, ind
+    for t, p in zip(tmp, paths):
+        os.replace(t, p)                                            # Readers never see a partial map
+
+    evict(cache_dir, max_bytes, keep=k)
+    return(tuple(np.load(p, mmap_mode='r') for p in paths))
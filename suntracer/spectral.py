@@ -0,0 +1,81 @@
+'''
+FILE: spectral.py
+AUTHOR: Mason Tea
+PURPOSE: Hyperspectral SGL renders with a chromatic PSF per wavelength slice.
+'''
+
+### LIBRARIES ###
+
+import numpy as np
+
+import convolve
+import pool
+import tracer
+
+### DEFINITIONS ###
+
+CHUNK = 8                                                           # Wavelength slices blurred per FFT at most
+MEMORY = 1.0E9                                                      # Default blur budget of one chunk [bytes]
+SLICE_BYTES = 160                                                   # Peak bytes of blurring a slice, per pixel
+
+### HYPERSPECTRAL RENDER ###
+
+# src is a data cube (n_lambda, ny, ny) with one source plane per wavelength
+# lams [m]. The lens is traced once for the whole cube (tracer.suntracer
+# treats the wavelengths as channels, so memory= bounds the tiles as usual)
+# and every slice is then blurred with the SGL PSF of its own wavelength
+# (convolve.convolve, kernels cached per wavelength), a chunk of slices per FFT.
+#
+# A full-size FFT blur peaks at about SLICE_BYTES per image pixel for every
+# slice of the chunk (the kernels and the padded transforms), measured with
+# tracemalloc. Unless chunk is given, chunks are sized like tracer.tile_rows
+# sizes tiles: as many slices as fit in memory (the memory= of the trace, or
+# MEMORY), at most CHUNK and at least one, so large images are blurred one
+# slice at a time. With workers > 1 every worker holds one chunk.
+#
+# If path is given the cube is streamed to a .npy memory map and never held in
+# memory as a whole; workers > 1 then blurs the chunks in a process pool, each
+# worker opening the memory map itself. Returns the cube and the number of
+# mapped rays.
+
+def _blur(cube, c0, c1, lams, z, scale, size):
+    cube[c0:c1] = convolve.convolve(np.asarray(cube[c0:c1]), lams[c0:c1], z, scale, size)
+
+def _blur_chunk(params, **shared):                                  # Blur one chunk of a cube on disk (pool worker)
+    path, c0, c1, lams, z, scale, size = params
+    cube = np.load(path, mmap_mode='r+')
+    _blur(cube, c0, c1, lams, z, scale, size)
+    cube.flush()
+    return(c1 - c0)
+
+def chunk_slices(nx, memory=None):                                  # Wavelength slices blurred per FFT
+    memory = MEMORY if memory is None else memory
+    return(int(min(CHUNK, max(1, memory // (SLICE_BYTES * nx * nx)))))
+
+def render(lens, src, nx, xl, yl, lams, z, scale, path=None, chunk=None, workers=1, size=None, **kwargs):
+    lams = [float(l) for l in lams]                                 # Lensed and blurred cube, mapped rays
+    if src.ndim != 3 or len(lams) != src.shape[0]:
+        raise ValueError('need a (n_lambda, ny, ny) cube with one wavelength per slice, got %s for %d wavelengths'
+                         % (src.shape, len(lams)))
+
+    shape = (len(lams), nx, nx)
+    dtype = np.result_type(src.dtype, np.float32)                   # Blurred integer cubes are not truncated
+    if path is None:
+        out = np.empty(shape, dtype=dtype)
+    else:
+        out = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=shape)
+    out, mapped = tracer.suntracer(lens, src, nx, xl, yl, out=out, **kwargs)
+
+    chunk = chunk_slices(nx, kwargs.get('memory')) if chunk is None else chunk
+    chunks = [(c0, min(c0 + chunk, len(lams))) for c0 in range(0, len(lams), chunk)]
+    if path is not None and workers > 1 and len(chunks) > 1:
+        out.flush()
+        params = [(path, c0, c1, lams, z, scale, size) for c0, c1 in chunks]
+        for done in pool.render(_blur_chunk, params, workers=workers):
+            pass
+    else:
+        for c0, c1 in chunks:
+            _blur(out, c0, c1, lams, z, scale, size)
+        if path is not None:
+            out.flush()
+    return(out, mapped)
@@ -7,10 +7,11 @@ PURPOSE: SunTracer is a raytracing simulation for strong gravitational lensing
 
 ### LIBRARIES ###
 
-import numpy as np
 import matplotlib.pyplot as plt
+from functools import partial
 
 import aux                                  # Auxiliary functions
+import tracer                               # Ray-shooting engine
 
 ### PLANE PARAMETERS ###
 
@@ -47,33 +48,15 @@ rpix_src = int(round(r_src/px_src))         # Radius of source in pixels
 # Source and image plane #
 
 src_plane = aux.cgs(n_src,rpix_src,i_src,j_src)     # Source is circular gaussian
-img_plane = np.zeros((n_img,n_img))                 # Image plane is empty
 
 ### RAYTRACE ###
 
-mapped = 0
-unmapped = 0
-
-for a in range(n_img):
-    for b in range(n_img):
-        # Image pixels to coordinates
-        x_coord = -rmap_img + b * px_img
-        y_coord = -rmap_img + a * px_img
-
-        # Deflection by point source
-        x_def, y_def = aux.pt_lens(x_coord,y_coord,x_lens,y_lens,m_lens)
-
-        # Coordinates back to pixels
-        y_px = int(round((x_def + rmap_src) / px_src))
-        x_px = int(round((y_def + rmap_src) / px_src))
-
-        # If a ray hits a pixel within the source, map that pixel on the image plane
-        # and count pixels which do map
-        if ((y_px >= 0) and (y_px < n_src) and (x_px >= 0) and (x_px < n_src)):
-            img_plane[a,b] = src_plane[x_px,y_px]
-            mapped += 1
-        else:
-            unmapped += 1
+lens = partial(aux.pt_lens, x1l=x_lens, x2l=y_lens, ml=m_lens)
+
+# Map every image pixel through the lens in one pass and count the rays which
+# land within the source plane
+img_plane, mapped = tracer.suntracer(lens, src_plane, n_img, rmap_img, rmap_src)
+unmapped = n_img**2 - mapped
 
 ### PLOTS ###
 
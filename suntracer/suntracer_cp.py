@@ -9,8 +9,10 @@ PURPOSE: Raytrace gravitational lensing by a point mass.
 import numpy as np
 import matplotlib.pyplot as plt
 import scipy as sci
+from functools import partial
 
 import aux
+import tracer
 
 ### DEFINITIONS ###
 
@@ -26,6 +28,7 @@ print("Einstein radius: ", aux.einrad(dl,ds))
 
 img_px = 5000                                                       # Pixels in image plane
 src_px = 2500                                                       # Pixels in source plane
+mem = 1.0E9                                                         # Memory budget per traced tile [bytes]
 
 extent_img = 1.0                               # Size of image plane covered [rad]
 extent_src = 1.0                               # Size of source plane covered [rad]
@@ -54,36 +57,13 @@ rpix = rad / ys                                                  # r (einrad) --
 # Make source, image planes
 
 src = aux.cgs(src_px,rpix,jpos,ipos)                                # Source plane (2D Gaussian)
-b = np.zeros((img_px,img_px))                                       # Image plane (initialized as empty)
-
-# Field of view variables
-
-c = 0                                                               # Number of pixels of planet seen by Einstein ring
-fov = 0                                                             # Percent of planet seen by Einstein ring
 
 ### RAYTRACER ###
 
-j1, j2 = np.mgrid[0:img_px,0:img_px]
-x1 = -extent_img + j2 * xs                                          #
-x2 = -extent_img + j1 * xs
-
-y1, y2 = aux.pt_lens(x1, x2, xlens+0.1, ylens, mlens)
-i2 = np.round((y1 + extent_src) / ys)
-i1 = np.round((y2 + extent_src) / ys)
-
-ind = (i1 >= 0) & (i1 < src_px) & (i2 >= 0) & (i2 < src_px)
-
-i1n = i1[ind]
-i2n = i2[ind]
-j1n = j1[ind]
-j2n = j2[ind]
-
-for i in np.arange(np.size(i1n)):
-    b[int(j1n[i]),int(j2n[i])] = src[int(i1n[i]),int(i2n[i])]
-    c += 1
-
+lens = partial(aux.pt_lens, x1l=xlens+0.1, x2l=ylens, ml=mlens)
+b, c = tracer.suntracer(lens, src, img_px, extent_img, extent_src, memory=mem)     # Image plane, pixels of planet seen by Einstein ring
 
-fov = float(c / (src_px * src_px))*100.0
+fov = float(c / (src_px * src_px))*100.0                            # Percent of planet seen by Einstein ring
 
 
 ### PLOT ###
@@ -7,8 +7,10 @@ PURPOSE: Raytrace gravitational lensing by a point mass.
 import numpy as np
 import matplotlib.pyplot as plt
 import scipy as sci
+from functools import partial
 
 import aux
+import tracer
 from PIL import Image
 from astropy.io import fits
 from astropy.visualization import astropy_mpl_style
@@ -84,31 +86,11 @@ src_r = aux.fitsim('images/fits/EPIC_red.fits')
 src_g = aux.fitsim('images/fits/EPIC_green.fits')
 src_b = aux.fitsim('images/fits/EPIC_blue.fits')
 
-img_r = np.zeros((nx,nx))                                               # Image plane
-img_g = np.zeros((nx,nx))                                               # Image plane
-img_b= np.zeros((nx,nx))                                               # Image plane
-
 ### RAYTRACER ###
 
-j1, j2 = np.mgrid[0:nx,0:nx]
-x1 = -xl + j2 * xs
-x2 = -xl + j1 * xs
-
-y1, y2 = aux.pt_lens(x1, x2, xlens+0.1, ylens, mlens)
-i2 = np.round((y1 + yl) / ys)
-i1 = np.round((y2 + yl) / ys)
-
-ind = (i1 >= 0) & (i1 < ny) & (i2 >= 0) & (i2 < ny)
-
-i1n = i1[ind]
-i2n = i2[ind]
-j1n = j1[ind]
-j2n = j2[ind]
-
-for i in np.arange(np.size(i1n)):
-    img_r[int(j1n[i]),int(j2n[i])] = src_r[int(i1n[i]),int(i2n[i])]
-    img_g[int(j1n[i]),int(j2n[i])] = src_g[int(i1n[i]),int(i2n[i])]
-    img_b[int(j1n[i]),int(j2n[i])] = src_b[int(i1n[i]),int(i2n[i])]
+lens = partial(aux.pt_lens, x1l=xlens+0.1, x2l=ylens, ml=mlens)
+src = np.stack((src_r, src_g, src_b))                               # Source planes (channel, ny, ny)
+img_r, img_g, img_b = tracer.suntracer(lens, src, nx, xl, yl)[0]    # Image planes, traced once for all channels
 
 ### PLOT ###
 
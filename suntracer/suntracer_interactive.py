@@ -1,6 +1,9 @@
 import numpy as np
 import matplotlib.pyplot as plt
+from functools import partial
+
 import aux as a
+import tracer
 
 
 ### DEFINITIONS ###
@@ -28,32 +31,21 @@ x_lst = np.arange(-1,1,0.1)
 y_lst = np.zeros(len(x_lst))
 
 
-count = 1
+rpix = int(round(rad / ys))
+src = a.cgs(ny,rpix,0,0)                                            # Source centred on the plane
+
+shifts = []                                                         # Source positions (row, column) [px]
 for m in range(len(x_lst)):
     ipos = int(round(x_lst[m] / ys))
     jpos = int(round(-y_lst[m] / ys))
-    rpix = int(round(rad / ys))
-
-    src = a.cgs(ny,rpix,jpos,ipos)
-    b = np.zeros((nx,nx))
+    shifts.append((jpos, ipos))
 
-    j1, j2 = np.mgrid[0:nx,0:nx]
-    x1 = -xl + j2 * xs
-    x2 = -xl + j1 * xs
+# Trace the lens once; every frame is a shift and gather of the same ray map
 
-    y1, y2 = a.pt_lens(x1, x2, xlens+0.1, ylens, mlens)
-    i2 = np.round((y1 + yl) / ys)
-    i1 = np.round((y2 + yl) / ys)
+lens = partial(a.pt_lens, x1l=xlens+0.1, x2l=ylens, ml=mlens)
 
-    ind = (i1 >= 0) & (i1 < ny) & (i2 >= 0) & (i2 < ny)
-
-    i1n = i1[ind]
-    i2n = i2[ind]
-    j1n = j1[ind]
-    j2n = j2[ind]
-
-    for i in np.arange(np.size(i1n)):
-        b[int(j1n[i]),int(j2n[i])] = src[int(i1n[i]),int(i2n[i])]
+count = 1
+for b in tracer.sweep(lens, src, nx, xl, yl, shifts):
 
     ### PLOT ###
 
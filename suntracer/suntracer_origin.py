@@ -7,8 +7,10 @@ PURPOSE: Raytrace gravitational lensing by a point mass.
 import numpy as np
 import matplotlib.pyplot as plt
 import scipy as sci
+from functools import partial
 
 import aux
+import tracer
 
 import PIL as pil
 
@@ -19,6 +21,7 @@ ny = 1000                                                             # Pixels i
 
 xl = 100.0                                                            # Size of image plane covered (theta_E)
 yl = 100.0                                                            # Size of source plane covered (theta_E)
+ss = 1                                                                # Sub-rays per image pixel side (anti-aliasing)
 
 ### LENS PARAMETERS ###
 
@@ -42,27 +45,11 @@ jpos = int(round(-ypos / ys))
 rpix = rad / ys
 
 src = aux.cgs(ny,rpix,jpos,ipos)                                      # Source plane
-b = np.zeros((nx,nx))                                               # Image plane
 
 ### RAYTRACER ###
 
-j1, j2 = np.mgrid[0:nx,0:nx]
-x1 = -xl + j2 * xs
-x2 = -xl + j1 * xs
-
-y1, y2 = aux.pt_lens(x1, x2, xlens+0.1, ylens, mlens)
-i2 = np.round((y1 + yl) / ys)
-i1 = np.round((y2 + yl) / ys)
-
-ind = (i1 >= 0) & (i1 < ny) & (i2 >= 0) & (i2 < ny)
-
-i1n = i1[ind]
-i2n = i2[ind]
-j1n = j1[ind]
-j2n = j2[ind]
-
-for i in np.arange(np.size(i1n)):
-    b[int(j1n[i]),int(j2n[i])] = src[int(i1n[i]),int(i2n[i])]
+lens = partial(aux.pt_lens, x1l=xlens+0.1, x2l=ylens, ml=mlens)
+b, mapped = tracer.suntracer(lens, src, nx, xl, yl, ss=ss)          # Image plane
 
 ### PLOT ###
 
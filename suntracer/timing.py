@@ -0,0 +1,97 @@
+'''
+FILE: timing.py
+AUTHOR: Mason Tea
+PURPOSE: Lightweight per-stage timing of the render pipeline.
+
+Set SUNTRACER_TIMING=1 (or call timing.enable()) and every pipeline stage
+wrapped in timing.stage(name) records its wall time, call count and peak
+bytes allocated (via tracemalloc). A report is printed to stderr at exit.
+When off, stage() hands back one shared no-op context manager.
+
+Only stages run in this process are recorded. Work done in pool.render
+workers (cli.py -j, spectral.render, noise.coadd and deconvolve.batch with
+workers > 1) is not: the workers exit through os._exit, so their atexit
+reports never run.
+'''
+
+### LIBRARIES ###
+
+import atexit
+import contextlib
+import os
+import sys
+import time
+import tracemalloc
+
+### DEFINITIONS ###
+
+ENABLED = False
+_stats = {}                                                         # name -> [calls, seconds, peak bytes]
+_stack = []                                                         # Stages currently open
+_registered = False                                                 # Report registered with atexit
+_null = contextlib.nullcontext()
+
+### STAGES ###
+
+class _Stage:
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        if _stack:                                                  # Fold the peak so far into the enclosing stage
+            _stack[-1].peak = max(_stack[-1].peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        self.base = self.peak = tracemalloc.get_traced_memory()[0]
+        _stack.append(self)
+        self.start = time.perf_counter()
+        return(self)
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        _stack.pop()
+        self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+        if _stack:
+            _stack[-1].peak = max(_stack[-1].peak, self.peak)
+        s = _stats.setdefault(self.name, [0, 0.0, 0])
+        s[0] += 1
+        s[1] += seconds
+        s[2] = max(s[2], self.peak - self.base)
+        return(False)
+
+def stage(name):                                                    # Context manager timing one pipeline stage
+    if not ENABLED:
+        return(_null)
+    return(_Stage(name))
+
+### CONTROL ###
+
+def enable():                                                       # Record stages and report them at exit
+    global ENABLED, _registered
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    if not _registered:
+        atexit.register(report)
+        _registered = True
+    ENABLED = True
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+def reset():
+    _stats.clear()
+
+def stats():                                                        # {name: (calls, seconds, peak bytes)}
+    return({k: tuple(v) for k, v in _stats.items()})
+
+def report(file=None):                                              # Table of every recorded stage
+    file = sys.stderr if file is None else file
+    if not _stats:
+        return
+    print('%-14s %8s %12s %12s %12s' % ('stage', 'calls', 'total [s]', 'mean [ms]', 'peak [MB]'), file=file)
+    for name, (calls, seconds, peak) in sorted(_stats.items(), key=lambda kv: -kv[1][1]):
+        print('%-14s %8d %12.4f %12.3f %12.1f' % (name, calls, seconds, 1000.0 * seconds / calls, peak / 2.0**20),
+              file=file)
+
+if os.environ.get('SUNTRACER_TIMING', '') not in ('', '0'):
+    enable()
@@ -0,0 +1,363 @@
+'''
+FILE: tracer.py
+AUTHOR: Mason Tea
+PURPOSE: Vectorized inverse ray-shooting engine shared by the suntracer scripts.
+'''
+
+### LIBRARIES ###
+
+import numpy as np
+
+import aux
+import kernels
+import timing
+
+### DEFINITIONS ###
+
+MEMORY = 1.0E9                                                      # Default tile budget of magmap [bytes]
+CULL_MAX = 0.5                                                      # Largest fraction of traced rays worth culling
+CULL_SAMPLES = 129                                                  # Rays per side of the culling estimate
+
+### LENS MODELS ###
+
+# A lens is any callable (x1, x2) -> (y1, y2) mapping image-plane coordinates
+# to source-plane coordinates (units of theta_E), e.g.
+#
+#     lens = functools.partial(aux.pt_lens, x1l=0.1, x2l=0.0, ml=1.0)
+
+### RAY MAP ###
+
+# rows = (r0, r1) restricts the trace to image rows r0 <= j1 < r1, so large
+# image planes can be traced one block of rows at a time. offset = (d1, d2)
+# moves every ray by a fraction of an image pixel along x1 and x2.
+#
+# The image plane is never materialized as index grids: the lens broadcasts a
+# row of x1 against a column of x2. dtype=np.float32 runs the lens and the
+# rounding in single precision (lean mode), roughly halving memory per ray.
+
+def axes(nx, xl, rows=None, offset=(0.0, 0.0), dtype=np.float64):   # x1 (1, nx) and x2 (rows, 1) of the image plane
+    xs = 2.0 * xl / (nx - 1)                                        # Pixel size on image map
+    r0, r1 = (0, nx) if rows is None else rows
+
+    x1 = -xl + (np.arange(nx) + offset[0]) * xs
+    x2 = -xl + (np.arange(r0, r1) + offset[1]) * xs
+    return(x1.astype(dtype)[None,:], x2.astype(dtype)[:,None])
+
+# rays returns the source-plane position of every ray [source px]; raymap
+# rounds it to the int32 source pixel hit by every image pixel.
+
+def rays(lens, nx, xl, ny, yl, rows=None, offset=(0.0, 0.0), dtype=np.float64):
+    ys = 2.0 * yl / (ny - 1)                                        # Pixel size on source map
+    with timing.stage('grid'):
+        x1, x2 = axes(nx, xl, rows, offset, dtype)
+
+    with timing.stage('deflection'):
+        y1, y2 = lens(x1, x2)
+        shape = np.broadcast_shapes(x2.shape, x1.shape)
+        p1 = y2 if y2.shape == shape else np.broadcast_to(y2, shape).copy()    # Full-size lens outputs are
+        p2 = y1 if y1.shape == shape else np.broadcast_to(y1, shape).copy()    # fresh, so reuse them in place
+        p1 += yl
+        p2 += yl
+        p1 /= ys
+        p2 /= ys
+    return(p1, p2)
+
+def onplane(i1, i2, ny):                                            # Rays whose nearest pixel lies on the source plane
+    i1 = np.round(i1)
+    i2 = np.round(i2)
+    return((i1 >= 0) & (i1 < ny) & (i2 >= 0) & (i2 < ny))
+
+def raymap(lens, nx, xl, ny, yl, rows=None, offset=(0.0, 0.0), dtype=np.float64):
+    i1, i2 = rays(lens, nx, xl, ny, yl, rows, offset, dtype)
+    with timing.stage('rounding'):
+        np.round(i1, out=i1)
+        np.round(i2, out=i2)
+
+        ind = (i1 >= 0) & (i1 < ny) & (i2 >= 0) & (i2 < ny)          # Rays which land on the source plane
+        off = ~ind
+        i1[off] = 0                                                 # Unmapped rays point at pixel (0,0)
+        i2[off] = 0                                                 # so the maps are always safe to index
+        i1 = i1.astype(np.int32)
+        i2 = i2.astype(np.int32)
+    return(i1, i2, ind)
+
+### GATHER ###
+
+# src may be a single plane (ny, ny) or a stack of planes (channels, ny, ny);
+# the lensed pixel indices are computed once and applied to every channel.
+# If out is given the image is written into it in place.
+
+def gather(src, i1, i2, ind, out=None):                             # Copy source pixels onto the image plane
+    if out is None:
+        out = np.empty(src.shape[:-2] + ind.shape, dtype=src.dtype)
+    out[...] = 0.0
+    out[..., ind] = src[..., i1[ind], i2[ind]]
+    return(out)
+
+### INTERPOLATION ###
+
+# order selects how a ray samples the source: 0 takes the nearest pixel, 1 is
+# bilinear and 3 is cubic spline interpolation. Spline coefficients are
+# computed once per source and reused for every ray.
+
+def coefficients(src, order):                                       # Interpolation coefficients of every source channel
+    from scipy import ndimage
+    planes = src.reshape((-1,) + src.shape[-2:])
+    if order > 1:
+        planes = np.stack([ndimage.spline_filter(a, order, output=np.float64, mode='nearest') for a in planes])
+    return(planes)
+
+def sample(coef, p1, p2, order, shape=()):                          # Interpolated source values at (p1, p2)
+    from scipy import ndimage
+    with timing.stage('interpolate'):
+        vals = [ndimage.map_coordinates(a, (p1, p2), order=order, mode='nearest', prefilter=False) for a in coef]
+        vals = np.stack(vals).reshape(shape + p1.shape)
+    return(vals)
+
+### FOOTPRINT CULLING ###
+
+# For a point lens (a functools.partial of aux.pt_lens) a ray at squared
+# distance d from the lens lands at source radius sqrt(d) |1 - ml/d|, which
+# depends on d alone. So every ray can be classified before it is traced:
+#
+#   - foot: it may land in the bounding disk of the non-zero source pixels
+#   - in:   it certainly lands on the source plane (but off the source)
+#   - out:  it certainly misses the source plane
+#
+# Only foot rays and rays too close to call are traced; the certain ones are
+# just counted, so the image and the mapped/unmapped statistics are unchanged.
+# Every band is widened by a safety margin so rounding can never misclassify,
+# and rays in the core around the lens, where the 1E-12 softening of
+# aux.pt_lens matters, are always traced. Classifying costs about as much as
+# tracing, so culling is dropped (culling returns None) when a coarse sample of
+# the image plane shows more than CULL_MAX of the rays would be traced anyway,
+# e.g. for a Gaussian source whose tails are non-zero over most of the plane.
+
+def nonzero_box(a):                                                 # Bounding box (lo1, hi1, lo2, hi2) of non-zero pixels
+    on = np.any(a.reshape((-1,) + a.shape[-2:]) != 0, axis=0)
+    if not on.any():
+        return(None)
+    rows = np.flatnonzero(on.any(axis=1))
+    cols = np.flatnonzero(on.any(axis=0))
+    return(rows[0], rows[-1], cols[0], cols[-1])
+
+def _band(ml, rmax):                                                # Squared image radii of rays landing within rmax
+    if rmax < 0:
+        return(None)
+    r_in, r_out = aux.annulus(ml, rmax)
+    return(r_in**2, r_out**2)
+
+def culling(lens, src, nx, xl, yl, pad=0, dtype=np.float64):        # Ray classes for a point lens, or None
+    if getattr(lens, 'func', None) is not aux.pt_lens or lens.args:
+        return(None)
+    x1l, x2l, ml = lens.keywords['x1l'], lens.keywords['x2l'], lens.keywords['ml']
+    ny = src.shape[-1]
+    ys = 2.0 * yl / (ny - 1)                                        # Pixel size on source map
+
+    lo = -yl - 0.5 * ys                                             # Edges of the source plane
+    hi = -yl + (ny - 0.5) * ys
+    dx = max(abs(lo - x1l), abs(hi - x1l))
+    dy = max(abs(lo - x2l), abs(hi - x2l))
+    r_plane = np.hypot(dx, dy)
+    if lo < x1l < hi and lo < x2l < hi:
+        r_inner = min(x1l - lo, hi - x1l, x2l - lo, hi - x2l)
+    else:
+        r_inner = -1.0
+
+    eps = 0.01 * ys + 64.0 * np.finfo(dtype).eps * (2.0 * xl + r_plane)
+    box = nonzero_box(src)
+    if r_inner - eps <= 0:                                          # Lens off the source plane: every ray would still
+        return(None)                                                # have to be traced to be counted
+    if box is None:
+        foot, hole = None, None
+    else:
+        c2 = -yl + 0.5 * (box[0] + box[1]) * ys - x2l               # Bounding disk of the non-zero pixels
+        c1 = -yl + 0.5 * (box[2] + box[3]) * ys - x1l
+        rad = 0.5 * ys * np.hypot(box[1] - box[0] + 1 + 2 * pad, box[3] - box[2] + 1 + 2 * pad)
+        if np.hypot(c1, c2) + rad >= r_plane:                       # Source fills the plane: nothing to cull
+            return(None)
+        foot = _band(ml, np.hypot(c1, c2) + rad + eps)
+        hole = _band(ml, np.hypot(c1, c2) - rad - eps)
+    core = 4.0 * (abs(ml) * 1.0E-12 / eps)**(1.0 / 3.0)              # Softening shifts rho by < eps beyond this radius
+    cut = (x1l, x2l, foot, hole, _band(ml, r_inner - eps), _band(ml, r_plane + eps), core**2)
+
+    x1, x2 = axes(CULL_SAMPLES, xl)                                 # Fraction of the plane culled() would trace
+    trace, sure = _classes((x1 - x1l)**2 + (x2 - x2l)**2, cut)
+    if trace.mean() > CULL_MAX:
+        return(None)
+    return(cut)
+
+def _within(d, band):
+    if band is None:
+        return(np.zeros(d.shape, dtype=bool))
+    return((d >= band[0]) & (d <= band[1]))
+
+def _classes(d, cut):                                               # Rays to trace and rays certain to hit
+    x1l, x2l, foot, hole, inner, plane, core = cut
+    hit = (_within(d, foot) & ~_within(d, hole)) | (d < core)
+    sure = _within(d, inner)
+    return(hit | (_within(d, plane) & ~sure), sure & ~hit)
+
+def culled(lens, nx, xl, ny, yl, cut, rows=None, offset=(0.0, 0.0), dtype=np.float64):
+    ys = 2.0 * yl / (ny - 1)                                        # Mapped rays (ind, p1, p2) and certain hits
+    x1l, x2l = cut[:2]
+    with timing.stage('grid'):
+        x1, x2 = axes(nx, xl, rows, offset, dtype)
+
+    with timing.stage('cull'):
+        d = (x1.astype(np.float64) - x1l)**2 + (x2.astype(np.float64) - x2l)**2
+        trace, sure = _classes(d, cut)
+        certain = int(np.count_nonzero(sure))
+
+    with timing.stage('deflection'):
+        y1, y2 = lens(np.broadcast_to(x1, d.shape)[trace], np.broadcast_to(x2, d.shape)[trace])
+        p1 = (y2 + yl) / ys
+        p2 = (y1 + yl) / ys
+    with timing.stage('rounding'):
+        on = onplane(p1, p2, ny)
+    ind = np.zeros(d.shape, dtype=bool)
+    ind[trace] = on
+    return(ind, p1[on], p2[on], certain)
+
+### SUNTRACER ###
+
+# memory caps the temporaries of a single tile [bytes]; the image plane is then
+# traced in blocks of rows, so peak memory scales with the tile instead of nx**2.
+# out may be a preallocated array or a memory map, e.g.
+#
+#     out = np.lib.format.open_memmap('ring.npy', mode='w+', dtype=src.dtype, shape=(nx,nx))
+#
+# ss > 1 shoots ss x ss sub-rays per image pixel and averages them, which
+# anti-aliases the Einstein ring and keeps the image flux from drifting with
+# resolution. The returned count is then the number of mapped sub-rays.
+# Sub-rays are summed in float64 and the average is cast back to the dtype
+# of out (rounded for integer images).
+# order > 0 interpolates the source between pixels (see INTERPOLATION) and
+# dtype=np.float32 selects the lean precision mode (see RAY MAP). cull=True
+# skips rays which cannot reach the source (see FOOTPRINT CULLING). With Numba
+# installed, jit=True traces point lenses at order 0 with the fused kernel of
+# kernels.py instead, which needs no temporaries (so no tiles or culling).
+# Returns the lensed image (or stack) of src and the number of mapped rays.
+
+# ray_bytes is the peak memory of one traced ray, fitted to tracemalloc
+# measurements of tiled traces (culled or not) to within a few percent: the
+# coordinates, indices and masks in the trace dtype, plus per channel the
+# gathered values, the sub-ray sums (ss > 1) and the interpolated samples
+# (order > 0). E.g. 56 bytes for a nearest-pixel double precision plane and
+# 48 in single precision. Spline coefficients (order > 1) are not included.
+
+def ray_bytes(channels=1, dtype=np.float64, ss=1, order=0):         # Peak bytes per traced ray
+    size = np.dtype(dtype).itemsize
+    base = 32 + 2 * size if order == 0 else 16 + 6 * size
+    return(base + channels * (8 + 16 * (ss > 1) + 8 * (order > 0)))
+
+def tile_rows(nx, memory=None, channels=1, dtype=np.float64, ss=1, order=0):
+    if memory is None:                                              # Image rows traced per tile
+        return(nx)
+    return(int(min(nx, max(1, memory // (nx * ray_bytes(channels, dtype, ss, order))))))
+
+def subrays(ss):                                                    # Sub-ray offsets within a pixel [px]
+    d = (np.arange(ss) + 0.5) / ss - 0.5
+    return([(d1, d2) for d2 in d for d1 in d])
+
+def suntracer(lens, src, nx, xl, yl, out=None, memory=None, ss=1, order=0, dtype=np.float64, cull=True, jit=True):
+    ny = src.shape[-1]
+    if out is None:
+        out = np.empty(src.shape[:-2] + (nx,nx), dtype=src.dtype)
+    if jit and order == 0 and kernels.fused(lens, src):
+        with timing.stage('fused'):
+            mapped = kernels.pt_gather(lens, src, out, nx, xl, yl, subrays(ss))
+        return(out, mapped)
+    coef = src if order == 0 else coefficients(src, order)
+    cut = culling(lens, coef, nx, xl, yl, order // 2 + (order > 0), dtype) if cull else None
+
+    step = tile_rows(nx, memory, int(np.prod(src.shape[:-2])), dtype, ss, order)
+    mapped = 0
+    for r0 in range(0, nx, step):
+        r1 = min(r0 + step, nx)
+        b = out[..., r0:r1, :]
+        acc = b if ss == 1 else np.zeros(b.shape)                   # Sum of the sub-rays of every pixel
+        for k, offset in enumerate(subrays(ss)):
+            if cut is not None:
+                ind, p1, p2, certain = culled(lens, nx, xl, ny, yl, cut, (r0,r1), offset, dtype)
+                mapped += certain
+            elif order == 0:
+                i1, i2, ind = raymap(lens, nx, xl, ny, yl, (r0,r1), offset, dtype)
+            else:
+                p1, p2 = rays(lens, nx, xl, ny, yl, (r0,r1), offset, dtype)
+                ind = onplane(p1, p2, ny)
+                p1, p2 = p1[ind], p2[ind]
+            if order > 0:
+                vals = sample(coef, p1, p2, order, src.shape[:-2])
+            with timing.stage('gather'):                            # Source lookup and write, once per pass
+                if order == 0 and cut is not None:
+                    vals = src[..., np.round(p1).astype(np.intp), np.round(p2).astype(np.intp)]
+                elif order == 0:
+                    vals = src[..., i1[ind], i2[ind]]
+                if ss == 1:
+                    b[...] = 0
+                    b[..., ind] = vals
+                else:
+                    acc[..., ind] += vals
+            mapped += int(np.count_nonzero(ind))
+        if ss > 1:
+            acc /= ss**2
+            if np.issubdtype(b.dtype, np.integer):
+                np.rint(acc, out=acc)
+            b[...] = acc
+    return(out, mapped)
+
+### MAGNIFICATION MAP ###
+
+# Forward ray shooting: a dense nx x nx grid of rays is traced through the lens
+# in tiles of rows and binned where it lands on the ny x ny source plane. Each
+# ray carries xs**2 of image-plane area, so rays per source pixel times
+# xs**2 / ys**2 is the magnification of that pixel. Memory is bounded by the
+# tile (MEMORY bytes unless memory is given), so nx can be pushed to ~3E4
+# (1E9 rays).
+
+def magmap(lens, nx, xl, ny, yl, memory=MEMORY, dtype=np.float64):     # Magnification of every source pixel
+    xs = 2.0 * xl / (nx - 1)                                        # Pixel size on image map
+    ys = 2.0 * yl / (ny - 1)                                        # Pixel size on source map
+
+    counts = np.zeros(ny * ny, dtype=np.int64)
+    step = tile_rows(nx, memory, dtype=dtype)
+    for r0 in range(0, nx, step):
+        r1 = min(r0 + step, nx)
+        i1, i2, ind = raymap(lens, nx, xl, ny, yl, (r0,r1), dtype=dtype)
+        with timing.stage('bin'):
+            counts += np.bincount(i1[ind].astype(np.int64) * ny + i2[ind], minlength=ny * ny)
+    return(counts.reshape(ny,ny) * (xs**2 / ys**2))
+
+def magnification(mu, src):                                         # Total magnification of a source from a magmap
+    return(float(np.sum(mu * src) / np.sum(src)))
+
+### SOURCE SWEEPS ###
+
+# Frames of a moving source are integer shifts (s1, s2) of one base source
+# along its rows and columns, frame[i1,i2] = src[i1-s1,i2-s2]. The lens is
+# traced once (or rmap is taken from raycache.raymap) and every frame is then
+# a shift of the ray map plus a gather. Frames are yielded one at a time and,
+# if path is a format string such as 'frame%03d.npy', saved as they are made.
+
+def sweep(lens, src, nx, xl, yl, shifts, path=None, rmap=None):     # Lensed frame for every source shift
+    ny = src.shape[-1]
+    i1, i2, ind = raymap(lens, nx, xl, ny, yl) if rmap is None else rmap
+    ind = np.asarray(ind)
+    j1 = np.asarray(i1[ind], dtype=np.intp)                         # Source pixels of the mapped rays only
+    j2 = np.asarray(i2[ind], dtype=np.intp)
+
+    for k, (s1, s2) in enumerate(shifts):
+        k1 = j1 - int(s1)
+        k2 = j2 - int(s2)
+        hit = (k1 >= 0) & (k1 < ny) & (k2 >= 0) & (k2 < ny)
+        sel = np.zeros_like(ind)
+        sel[ind] = hit
+
+        with timing.stage('gather'):
+            b = np.zeros(src.shape[:-2] + ind.shape, dtype=src.dtype)
+            b[..., sel] = src[..., k1[hit], k2[hit]]
+        if path is not None:
+            with timing.stage('save'):
+                np.save(path % k, b)
+        yield b